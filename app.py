@@ -3,26 +3,276 @@ Fraud Detection System for Banking Transactions
 Flask Backend Application
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, session, make_response
+import os
 import sqlite3
+import functools
+from collections import namedtuple
+import threading
+import queue
+import atexit
+import math
 from datetime import datetime
+from db_init import SCHEMA_VERSION
 
 app = Flask(__name__)
 app.secret_key = 'fraud_detection_secret_key_2024'  # Required for flash messages
 
-def get_connection():
-    """Create and return a database connection and cursor."""
-    conn = sqlite3.connect('db.sqlite')
+TRANSACTIONS_PER_PAGE = 50
+STREAM_BATCH_SIZE = 256  # Rows fetched per fetchmany() while streaming a page
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'  # Format the fraud triggers' datetime() expects
+WRITE_BATCH_SIZE = 32  # Most queued writes the background writer commits together
+WRITE_TIMEOUT = 30  # Seconds a request waits for the background writer before giving up
+# Set once per process at import, so a deploy with changed templates invalidates old ETags
+BUILD_TOKEN = datetime.now().strftime('%Y%m%d%H%M%S')
+
+# ============ SQL ============
+# Defined once so every call passes the same string and hits the
+# connection's prepared statement cache
+
+SQL_INSERT_TXN = """
+    INSERT INTO transactions 
+    (transaction_id, user_id, amount, location, txn_time, txn_type, status)
+    VALUES (?, ?, ?, ?, ?, ?, 'OK')
+"""
+
+SQL_SELECT_TXN_BY_ID = "SELECT * FROM transactions WHERE transaction_id = ?"
+
+# Cheap change token: the AUTOINCREMENT sequence grows on every insert (updates
+# re-insert the row) and trg_count_txn_deletes counts deletes, so the pair
+# changes on every committed write without reading the transactions table
+SQL_SELECT_TXN_VERSION = """
+    SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'transactions') AS inserts,
+           (SELECT count FROM txn_deletes WHERE id = 1) AS deletes
+"""
+
+SQL_SELECT_TXN_TOTALS = """
+    SELECT COUNT(*) AS total, COALESCE(SUM(status = 'FLAGGED'), 0) AS flagged
+    FROM transactions
+"""
+
+SQL_SELECT_TXN_PAGE = """
+    SELECT * FROM transactions 
+    ORDER BY txn_time DESC
+    LIMIT ? OFFSET ?
+"""
+
+SQL_DELETE_TXN = "DELETE FROM transactions WHERE transaction_id = ?"
+
+# Alert counts for the fraud page summary, so the rows themselves can be streamed
+SQL_SELECT_ALERT_SUMMARY = """
+    SELECT COUNT(*) AS total,
+           COALESCE(SUM(instr(reason, 'High amount') > 0), 0) AS high_amount,
+           COALESCE(SUM(instr(reason, 'Rapid') > 0), 0) AS rapid
+    FROM fraud_alerts
+"""
+
+# Only the columns fraud_alerts.html displays
+SQL_SELECT_VW_SUSPICIOUS = """
+    SELECT transaction_id, user_id, amount, reason, flagged_at,
+           location, txn_time, txn_type
+    FROM vw_suspicious
+    ORDER BY flagged_at DESC
+"""
+
+# One pooled connection per thread instead of reopening the file per request
+_local = threading.local()
+_connections = {}
+_connections_lock = threading.Lock()
+
+class SchemaOutOfDateError(sqlite3.OperationalError):
+    """The database predates the constraints and triggers the app relies on."""
+
+def _open_connection():
+    """Open and configure a connection owned by the current thread."""
+    # timeout is SQLite's busy timeout: wait up to 5 s for another worker's write lock
+    conn = sqlite3.connect('db.sqlite', timeout=5.0, check_same_thread=False,
+                           isolation_level=None, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    try:
+        # Alert cleanup (ON DELETE CASCADE), the amount CHECK and the page cache's
+        # delete counter only exist once db_init.py has brought the schema up to date
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            raise SchemaOutOfDateError(
+                f"Database schema is at version {version}, expected {SCHEMA_VERSION}; "
+                "run python db_init.py to upgrade it")
+        # Switching to WAL needs a moment with no other open transactions, so this can fail
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")
+        conn.execute("PRAGMA mmap_size=268435456")  # Serve reads from a 256 MB memory map instead of read() calls
+        conn.execute("PRAGMA foreign_keys=ON")  # Deleting a transaction cascades to its fraud alerts
+    except sqlite3.Error:
+        conn.close()
+        raise
+    with _connections_lock:
+        # Close connections left behind by threads that have since exited
+        for thread in [t for t in _connections if not t.is_alive()]:
+            _connections.pop(thread).close()
+        _connections[threading.current_thread()] = conn
+    return conn
+
+def get_connection():
+    """Return the thread's pooled database connection and a new cursor."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = _open_connection()
     cursor = conn.cursor()
     return conn, cursor
 
+@app.errorhandler(SchemaOutOfDateError)
+def schema_out_of_date(error):
+    """Refuse to serve from an old schema rather than corrupt it."""
+    return str(error), 503, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.teardown_appcontext
+def release_connection(exception):
+    """Roll back anything a request left open so the pooled connection stays clean."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+@atexit.register
+def close_connections():
+    """Close every pooled connection on interpreter shutdown."""
+    with _connections_lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+# ============ BACKGROUND WRITER ============
+# Inserts are queued to one writer thread that commits them in batches,
+# so concurrent requests share a single fsync instead of paying one each
+
+class WriteTask:
+    """A queued write statement and the outcome the request thread waits on."""
+    
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+        self.event = threading.Event()
+        self.error = None
+        self.claimed = False
+        self.cancelled = False
+        self._lock = threading.Lock()
+    
+    def claim(self):
+        """Mark the task as taken by the writer; False if the request gave up on it."""
+        with self._lock:
+            self.claimed = not self.cancelled
+            return self.claimed
+    
+    def cancel(self):
+        """Withdraw the task before the writer runs it; False if it already has."""
+        with self._lock:
+            self.cancelled = not self.claimed
+            return self.cancelled
+
+write_queue = queue.Queue()
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+def _writer_loop():
+    """Apply queued writes, committing each batch in one transaction."""
+    conn = None
+    while True:
+        tasks = [write_queue.get()]
+        while len(tasks) < WRITE_BATCH_SIZE:
+            try:
+                tasks.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        try:
+            # (Re)opened per batch as needed, so a failed open only fails this batch
+            if conn is None:
+                conn = _open_connection()
+            conn.execute("BEGIN IMMEDIATE")
+            for task in tasks:
+                # Skip writes whose request has already timed out and reported failure
+                if not task.claim():
+                    continue
+                # A savepoint per task lets one failed write roll back on its own
+                conn.execute("SAVEPOINT task")
+                try:
+                    conn.execute(task.sql, task.params)
+                except sqlite3.Error as e:
+                    task.error = e
+                    conn.execute("ROLLBACK TO task")
+                conn.execute("RELEASE task")
+            conn.execute("COMMIT")
+        except Exception as e:
+            # Fail the whole batch, but keep the thread alive for the next one
+            for task in tasks:
+                task.error = task.error or e
+            if conn is not None and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    conn.close()
+                    conn = None
+        finally:
+            for task in tasks:
+                task.event.set()
+
+def submit_write(sql, params):
+    """Queue a write for the background writer and wait until it is committed."""
+    global _writer_thread
+    # Started on first use so each worker process (e.g. after a fork) gets its own,
+    # and restarted if it has died
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name='sqlite-writer', daemon=True)
+            _writer_thread.start()
+    
+    task = WriteTask(sql, params)
+    write_queue.put(task)
+    if not task.event.wait(WRITE_TIMEOUT):
+        if task.cancel():
+            raise sqlite3.OperationalError('Timed out waiting for the database writer')
+        # The writer already started on it, so wait for the real outcome
+        task.event.wait()
+    if task.error is not None:
+        raise task.error
+
+@functools.lru_cache(maxsize=None)
+def row_class(columns):
+    """Return the namedtuple type for a result set's column names."""
+    return namedtuple('Row', columns)
+
+def use_namedtuple_rows(cursor):
+    """Make an executed cursor return namedtuples instead of sqlite3.Row objects."""
+    # Jinja reads txn.status as an attribute; sqlite3.Row only answers that
+    # after a failed getattr, while a namedtuple answers it directly
+    make_row = row_class(tuple(column[0] for column in cursor.description))._make
+    cursor.row_factory = lambda _cursor, row: make_row(row)
+
+# Rendered HTML for pages that take no parameters, keyed by template name
+_static_pages = {}
+
+def can_use_page_cache():
+    """Whether this request may be served from (and stored in) a page cache."""
+    # base.html renders pending flash messages, and debug mode reloads edited
+    # templates, so those requests must render fresh
+    return not app.debug and '_flashes' not in session
+
+def render_static_page(template):
+    """Render a parameterless page once and serve the cached HTML afterwards."""
+    if not can_use_page_cache():
+        return render_template(template)
+    html = _static_pages.get(template)
+    if html is None:
+        html = _static_pages[template] = render_template(template)
+    return html
+
 # ============ ROUTES ============
 
 @app.route('/')
 def home():
     """Home page route."""
-    return render_template('home.html')
+    return render_static_page('home.html')
 
 @app.route('/add', methods=['GET', 'POST'])
 def add_transaction():
@@ -40,69 +290,93 @@ def add_transaction():
             flash('Please fill all required fields!', 'error')
             return render_template('add_transaction.html')
         
+        # Positive amounts are enforced by the table's CHECK constraint
         try:
             amount = float(amount)
-            if amount <= 0:
-                flash('Amount must be greater than 0!', 'error')
-                return render_template('add_transaction.html')
         except ValueError:
             flash('Invalid amount format!', 'error')
             return render_template('add_transaction.html')
         
-        # Convert datetime-local format to SQLite format
-        if not txn_time:
-            txn_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            # Convert from datetime-local format (YYYY-MM-DDTHH:MM) to SQLite format (YYYY-MM-DD HH:MM:SS)
-            txn_time = txn_time.replace('T', ' ') + ':00'
+        # Convert datetime-local format (YYYY-MM-DDTHH:MM[:SS]) to SQLite format (YYYY-MM-DD HH:MM:SS)
+        try:
+            parsed_time = datetime.fromisoformat(txn_time) if txn_time else datetime.now()
+            txn_time = parsed_time.strftime(SQLITE_DATETIME_FORMAT)
+        except ValueError:
+            flash('Invalid transaction time format!', 'error')
+            return render_template('add_transaction.html')
         
-        conn, cursor = get_connection()
         try:
-            # Check if transaction_id already exists
-            cursor.execute("SELECT transaction_id FROM transactions WHERE transaction_id = ?", (transaction_id,))
-            if cursor.fetchone():
-                flash('Transaction ID already exists!', 'error')
-                return render_template('add_transaction.html')
-            
-            # Insert transaction
-            cursor.execute("""
-                INSERT INTO transactions 
-                (transaction_id, user_id, amount, location, txn_time, txn_type, status)
-                VALUES (?, ?, ?, ?, ?, ?, 'OK')
-            """, (transaction_id, user_id, amount, location, txn_time, txn_type))
-            
-            conn.commit()
+            # Insert transaction (the UNIQUE transaction_id rejects duplicates);
+            # the writer thread has already rolled back a failed insert
+            submit_write(SQL_INSERT_TXN, (transaction_id, user_id, amount, location, txn_time, txn_type))
             flash('Transaction added successfully! Fraud detection triggered automatically.', 'success')
             return redirect(url_for('view_transactions'))
             
-        except sqlite3.IntegrityError:
-            flash('Transaction ID already exists!', 'error')
-            conn.rollback()
+        except sqlite3.IntegrityError as e:
+            if 'positive_amount' in str(e):
+                flash('Amount must be greater than 0!', 'error')
+            else:
+                flash('Transaction ID already exists!', 'error')
+        except SchemaOutOfDateError:
+            # Raised by the writer thread's connection; answered by schema_out_of_date
+            raise
         except sqlite3.Error as e:
             flash(f'Database error: {str(e)}', 'error')
-            conn.rollback()
-        finally:
-            conn.close()
     
     # GET request - show form
     return render_template('add_transaction.html')
 
+def render_txn_page(page):
+    """Render one page of the transactions table."""
+    conn, cursor = get_connection()
+    try:
+        # Totals for the summary come from one aggregate instead of the full row list
+        cursor.execute(SQL_SELECT_TXN_TOTALS)
+        totals = cursor.fetchone()
+        pages = max(math.ceil(totals['total'] / TRANSACTIONS_PER_PAGE), 1)
+        page = min(page, pages)
+        
+        # ORDER BY ... LIMIT walks idx_txn_time backwards, so only one page is read
+        cursor.execute(SQL_SELECT_TXN_PAGE, (TRANSACTIONS_PER_PAGE, (page - 1) * TRANSACTIONS_PER_PAGE))
+        use_namedtuple_rows(cursor)
+        transactions = cursor.fetchall()
+        return render_template('view_transactions.html', transactions=transactions,
+                               total=totals['total'], flagged=totals['flagged'],
+                               page=page, pages=pages)
+    finally:
+        cursor.close()
+
+@functools.lru_cache(maxsize=8)
+def cached_txn_page(version, page):
+    """Recently rendered pages; the version argument changes with every write."""
+    return render_txn_page(page)
+
 @app.route('/transactions')
 def view_transactions():
-    """View all transactions route."""
+    """View transactions route, one page at a time."""
+    page = max(request.args.get('page', 1, type=int), 1)
     conn, cursor = get_connection()
     try:
-        cursor.execute("""
-            SELECT * FROM transactions 
-            ORDER BY txn_time DESC
-        """)
-        transactions = cursor.fetchall()
-        return render_template('view_transactions.html', transactions=transactions)
+        if not can_use_page_cache():
+            return render_txn_page(page)
+        
+        cursor.execute(SQL_SELECT_TXN_VERSION)
+        version = tuple(cursor.fetchone())
+        etag = f"txn-{BUILD_TOKEN}-{version[0]}-{version[1]}-{page}"
+        
+        # Unchanged table: answer 304 to a matching If-None-Match, else reuse the rendered page
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(cached_txn_page(version, page))
+        response.set_etag(etag)
+        return response
     except sqlite3.Error as e:
         flash(f'Database error: {str(e)}', 'error')
-        return render_template('view_transactions.html', transactions=[])
+        return render_template('view_transactions.html', transactions=[],
+                               total=0, flagged=0, page=1, pages=1)
     finally:
-        conn.close()
+        cursor.close()
 
 @app.route('/update/<transaction_id>', methods=['GET', 'POST'])
 def update_transaction(transaction_id):
@@ -121,73 +395,50 @@ def update_transaction(transaction_id):
             flash('Please fill all required fields!', 'error')
             return redirect(url_for('update_transaction', transaction_id=transaction_id))
         
+        # Positive amounts are enforced by the table's CHECK constraint
         try:
             amount = float(amount)
-            if amount <= 0:
-                flash('Amount must be greater than 0!', 'error')
-                return redirect(url_for('update_transaction', transaction_id=transaction_id))
         except ValueError:
             flash('Invalid amount format!', 'error')
             return redirect(url_for('update_transaction', transaction_id=transaction_id))
         
-        # Convert datetime-local format to SQLite format
-        if txn_time:
-            txn_time = txn_time.replace('T', ' ') + ':00'
+        # Convert datetime-local format (YYYY-MM-DDTHH:MM[:SS]) to SQLite format (YYYY-MM-DD HH:MM:SS)
+        try:
+            txn_time = datetime.fromisoformat(txn_time).strftime(SQLITE_DATETIME_FORMAT)
+        except ValueError:
+            flash('Invalid transaction time format!', 'error')
+            return redirect(url_for('update_transaction', transaction_id=transaction_id))
         
         try:
-            cursor.execute("""
-                UPDATE transactions 
-                SET user_id = ?, amount = ?, location = ?, txn_time = ?, txn_type = ?, status = 'OK'
-                WHERE transaction_id = ?
-            """, (user_id, amount, location, txn_time, txn_type, transaction_id))
-            
-            conn.commit()
-            
-            # Re-trigger fraud detection by deleting and re-inserting fraud alerts
-            # (This is a simplified approach - in production, you'd have a stored procedure)
-            cursor.execute("DELETE FROM fraud_alerts WHERE transaction_id = ?", (transaction_id,))
-            
-            # Check high amount
-            if amount > 10000:
-                cursor.execute("""
-                    INSERT INTO fraud_alerts (transaction_id, user_id, amount, reason)
-                    VALUES (?, ?, ?, ?)
-                """, (transaction_id, user_id, amount, 
-                      f'High amount transaction: ₹{amount} exceeds ₹10,000 limit'))
-                cursor.execute("UPDATE transactions SET status = 'FLAGGED' WHERE transaction_id = ?", 
-                             (transaction_id,))
+            # Re-run fraud detection by deleting and re-inserting the row so the
+            # INSERT triggers in db_init.py flag it, all in one write transaction;
+            # the delete cascades to the row's old fraud alerts
+            conn.execute("BEGIN IMMEDIATE")
+            cursor.execute(SQL_DELETE_TXN, (transaction_id,))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                flash('Transaction not found!', 'error')
+                return redirect(url_for('view_transactions'))
             
-            # Check rapid transactions
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM transactions
-                WHERE user_id = ? 
-                    AND txn_time >= datetime(?, '-5 minutes')
-                    AND txn_time <= ?
-            """, (user_id, txn_time, txn_time))
-            result = cursor.fetchone()
-            if result and result['count'] > 5:
-                cursor.execute("""
-                    INSERT INTO fraud_alerts (transaction_id, user_id, amount, reason)
-                    VALUES (?, ?, ?, ?)
-                """, (transaction_id, user_id, amount, 
-                      f'Rapid transactions detected: {result["count"]} transactions within 5 minutes'))
-                cursor.execute("UPDATE transactions SET status = 'FLAGGED' WHERE transaction_id = ?", 
-                             (transaction_id,))
+            cursor.execute(SQL_INSERT_TXN, (transaction_id, user_id, amount, location, txn_time, txn_type))
             
             conn.commit()
             flash('Transaction updated successfully!', 'success')
             return redirect(url_for('view_transactions'))
             
         except sqlite3.Error as e:
-            flash(f'Database error: {str(e)}', 'error')
+            if 'positive_amount' in str(e):
+                flash('Amount must be greater than 0!', 'error')
+            else:
+                flash(f'Database error: {str(e)}', 'error')
             conn.rollback()
+            return redirect(url_for('update_transaction', transaction_id=transaction_id))
         finally:
-            conn.close()
+            cursor.close()
     
     # GET request - show edit form
     try:
-        cursor.execute("SELECT * FROM transactions WHERE transaction_id = ?", (transaction_id,))
+        cursor.execute(SQL_SELECT_TXN_BY_ID, (transaction_id,))
         transaction = cursor.fetchone()
         if not transaction:
             flash('Transaction not found!', 'error')
@@ -197,44 +448,61 @@ def update_transaction(transaction_id):
         flash(f'Database error: {str(e)}', 'error')
         return redirect(url_for('view_transactions'))
     finally:
-        conn.close()
+        cursor.close()
 
 @app.route('/delete/<transaction_id>')
 def delete_transaction(transaction_id):
     """Delete transaction route."""
     conn, cursor = get_connection()
     try:
-        # Also delete associated fraud alerts
-        cursor.execute("DELETE FROM fraud_alerts WHERE transaction_id = ?", (transaction_id,))
-        cursor.execute("DELETE FROM transactions WHERE transaction_id = ?", (transaction_id,))
-        conn.commit()
+        # Associated fraud alerts are removed by ON DELETE CASCADE
+        cursor.execute(SQL_DELETE_TXN, (transaction_id,))
         flash('Transaction deleted successfully!', 'success')
     except sqlite3.Error as e:
         flash(f'Database error: {str(e)}', 'error')
-        conn.rollback()
     finally:
-        conn.close()
+        cursor.close()
     return redirect(url_for('view_transactions'))
 
+def iter_rows(cursor):
+    """Yield a cursor's rows in fetchmany() batches, closing it when exhausted."""
+    try:
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
 @app.route('/fraud')
 def fraud_alerts():
     """View fraud alerts route."""
     conn, cursor = get_connection()
     try:
+        cursor.execute(SQL_SELECT_ALERT_SUMMARY)
+        summary = dict(cursor.fetchone())
         # Using the view for better data
-        cursor.execute("SELECT * FROM vw_suspicious ORDER BY flagged_at DESC")
-        alerts = cursor.fetchall()
-        return render_template('fraud_alerts.html', alerts=alerts)
+        cursor.execute(SQL_SELECT_VW_SUSPICIOUS)
+        use_namedtuple_rows(cursor)
     except sqlite3.Error as e:
+        cursor.close()
         flash(f'Database error: {str(e)}', 'error')
-        return render_template('fraud_alerts.html', alerts=[])
-    finally:
-        conn.close()
+        return render_template('fraud_alerts.html', alerts=[],
+                               summary={'total': 0, 'high_amount': 0, 'rapid': 0})
+    
+    # Pending flash messages are popped from the session while rendering, which a
+    # streamed response can no longer save, so those requests render in one go
+    if '_flashes' in session:
+        return render_template('fraud_alerts.html', alerts=iter_rows(cursor), summary=summary)
+    
+    # Stream the table so rows are fetched in batches as the HTML is sent
+    return stream_template('fraud_alerts.html', alerts=iter_rows(cursor), summary=summary)
 
 @app.route('/about')
 def about():
     """About page route."""
-    return render_template('about.html')
+    return render_static_page('about.html')
 
 if __name__ == '__main__':
     print("=" * 50)
@@ -243,5 +511,6 @@ if __name__ == '__main__':
     print("Server starting on http://127.0.0.1:5000")
     print("Press Ctrl+C to stop")
     print("=" * 50)
-    app.run(debug=True, port=5000)
+    # Development server only; see README for running under gunicorn
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', port=5000)
 
@@ -4,44 +4,98 @@ Run this script once to create the database, tables, views, indexes, and trigger
 """
 
 import sqlite3
+import itertools
 from datetime import datetime
 
+# SQLite's default cap on bound parameters per statement
+SQLITE_MAX_VARIABLES = 999
+
+# Stored in PRAGMA user_version once the DDL below has run; bump it whenever the DDL changes
+SCHEMA_VERSION = 2
+
+# Column definitions, shared by create_tables and the rebuilds in upgrade_tables
+TRANSACTIONS_COLUMNS = """
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id TEXT UNIQUE NOT NULL,
+    user_id TEXT NOT NULL,
+    amount REAL NOT NULL CONSTRAINT positive_amount CHECK(amount > 0),
+    location TEXT NOT NULL,
+    txn_time TEXT NOT NULL,
+    txn_type TEXT NOT NULL CHECK(txn_type IN ('Credit', 'Debit')),
+    status TEXT DEFAULT 'OK'
+"""
+
+# Alerts are removed together with their transaction
+FRAUD_ALERTS_COLUMNS = """
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id TEXT NOT NULL REFERENCES transactions(transaction_id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    amount REAL NOT NULL,
+    reason TEXT NOT NULL,
+    flagged_at TEXT DEFAULT (datetime('now'))
+"""
+
 def get_connection():
     """Create and return a database connection and cursor."""
-    conn = sqlite3.connect('db.sqlite')
+    conn = sqlite3.connect('db.sqlite', isolation_level=None)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA page_size=4096")  # Only takes effect while the database file is still empty
     cursor = conn.cursor()
     return conn, cursor
 
+def rebuild_table(cursor, table, columns, keep_rows):
+    """Recreate a table with new column definitions, copying the rows that satisfy them."""
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    old_count = cursor.fetchone()[0]
+    
+    cursor.execute(f"CREATE TABLE {table}_new ({columns})")
+    cursor.execute(f"INSERT INTO {table}_new SELECT * FROM {table} WHERE {keep_rows}")
+    copied = cursor.rowcount
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    
+    print(f"✓ Rebuilt {table} ({copied} rows kept, {old_count - copied} dropped)")
+
+def upgrade_tables(cursor):
+    """Rebuild tables created by older versions of this script that lack newer constraints."""
+    print("Checking existing tables...")
+    
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'")
+    existing = {row['name']: row['sql'] for row in cursor.fetchall()}
+    
+    # The view is recreated by create_view; drop it so tables can be swapped underneath
+    cursor.execute("DROP VIEW IF EXISTS vw_suspicious")
+    
+    # Rebuild transactions first, while fraud_alerts has no cascading key that its DROP would fire
+    if 'transactions' in existing and 'positive_amount' not in existing['transactions']:
+        rebuild_table(cursor, 'transactions', TRANSACTIONS_COLUMNS, "amount > 0")
+    
+    if 'fraud_alerts' in existing and 'REFERENCES' not in existing['fraud_alerts']:
+        rebuild_table(cursor, 'fraud_alerts', FRAUD_ALERTS_COLUMNS,
+                      "transaction_id IN (SELECT transaction_id FROM transactions)")
+    
+    print("✓ Tables checked successfully")
+
 def create_tables(cursor):
     """Create all required tables."""
     print("Creating tables...")
     
     # Create transactions table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            transaction_id TEXT UNIQUE NOT NULL,
-            user_id TEXT NOT NULL,
-            amount REAL NOT NULL,
-            location TEXT NOT NULL,
-            txn_time TEXT NOT NULL,
-            txn_type TEXT NOT NULL CHECK(txn_type IN ('Credit', 'Debit')),
-            status TEXT DEFAULT 'OK'
-        )
-    """)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS transactions ({TRANSACTIONS_COLUMNS})")
     
     # Create fraud_alerts table
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS fraud_alerts ({FRAUD_ALERTS_COLUMNS})")
+    
+    # Single-row counter of deleted transactions; together with the AUTOINCREMENT
+    # sequence it gives the app a cheap token that changes on every write
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS fraud_alerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            transaction_id TEXT NOT NULL,
-            user_id TEXT NOT NULL,
-            amount REAL NOT NULL,
-            reason TEXT NOT NULL,
-            flagged_at TEXT DEFAULT (datetime('now'))
+        CREATE TABLE IF NOT EXISTS txn_deletes (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            count INTEGER NOT NULL DEFAULT 0
         )
     """)
+    cursor.execute("INSERT OR IGNORE INTO txn_deletes (id, count) VALUES (1, 0)")
     
     print("✓ Tables created successfully")
 
@@ -50,28 +104,48 @@ def create_indexes(cursor):
     print("Creating indexes...")
     
     try:
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_user_id ON transactions(user_id)
-        """)
+        # idx_user_time already serves user_id lookups through its leading column
+        cursor.execute("DROP INDEX IF EXISTS idx_user_id")
         
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_txn_time ON transactions(txn_time)
         """)
         
+        # Covers the rapid-transaction trigger's COUNT(*) without touching table rows
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_user_time ON transactions(user_id, txn_time)
         """)
         
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_flagged_at ON fraud_alerts(flagged_at)
+        """)
+        
+        # Lets the ON DELETE CASCADE find a transaction's alerts without a table scan
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_alert_txn ON fraud_alerts(transaction_id)
+        """)
+        
         print("✓ Indexes created successfully")
     except sqlite3.Error as e:
         print(f"Index creation note: {e}")
 
+def analyze_tables(cursor):
+    """Refresh planner statistics so SQLite picks the right indexes."""
+    print("Analyzing tables...")
+    
+    cursor.execute("ANALYZE transactions")
+    cursor.execute("ANALYZE fraud_alerts")
+    
+    print("✓ Statistics updated successfully")
+
 def create_view(cursor):
     """Create view for suspicious transactions."""
     print("Creating view...")
     
+    # Recreate so existing databases pick up the current definition
+    cursor.execute("DROP VIEW IF EXISTS vw_suspicious")
     cursor.execute("""
-        CREATE VIEW IF NOT EXISTS vw_suspicious AS
+        CREATE VIEW vw_suspicious AS
         SELECT 
             fa.id,
             fa.transaction_id,
@@ -84,7 +158,6 @@ def create_view(cursor):
             t.txn_type
         FROM fraud_alerts fa
         LEFT JOIN transactions t ON fa.transaction_id = t.transaction_id
-        ORDER BY fa.flagged_at DESC
     """)
     
     print("✓ View created successfully")
@@ -93,9 +166,14 @@ def create_triggers(cursor):
     """Create triggers for automatic fraud detection."""
     print("Creating triggers...")
     
+    # Recreate so existing databases pick up the current definitions
+    cursor.execute("DROP TRIGGER IF EXISTS trg_flag_high_amount")
+    cursor.execute("DROP TRIGGER IF EXISTS trg_flag_rapid_txns")
+    cursor.execute("DROP TRIGGER IF EXISTS trg_count_txn_deletes")
+    
     # Trigger 1: Flag high amount transactions (> ₹10,000)
     cursor.execute("""
-        CREATE TRIGGER IF NOT EXISTS trg_flag_high_amount
+        CREATE TRIGGER trg_flag_high_amount
         AFTER INSERT ON transactions
         FOR EACH ROW
         WHEN NEW.amount > 10000
@@ -112,7 +190,7 @@ def create_triggers(cursor):
     
     # Trigger 2: Flag rapid transactions (more than 5 transactions within 5 minutes)
     cursor.execute("""
-        CREATE TRIGGER IF NOT EXISTS trg_flag_rapid_txns
+        CREATE TRIGGER trg_flag_rapid_txns
         AFTER INSERT ON transactions
         FOR EACH ROW
         BEGIN
@@ -124,18 +202,24 @@ def create_triggers(cursor):
                 'Rapid transactions detected: ' || COUNT(*) || ' transactions within 5 minutes'
             FROM transactions
             WHERE user_id = NEW.user_id
-                AND txn_time >= datetime(NEW.txn_time, '-5 minutes')
-                AND txn_time <= NEW.txn_time
+                AND txn_time BETWEEN datetime(NEW.txn_time, '-5 minutes') AND NEW.txn_time
             HAVING COUNT(*) > 5;
             
+            -- changes() is the row count of the INSERT above, so the window is counted once
             UPDATE transactions 
             SET status = 'FLAGGED' 
             WHERE transaction_id = NEW.transaction_id
-                AND (SELECT COUNT(*) 
-                     FROM transactions 
-                     WHERE user_id = NEW.user_id
-                         AND txn_time >= datetime(NEW.txn_time, '-5 minutes')
-                         AND txn_time <= NEW.txn_time) > 5;
+                AND changes() > 0;
+        END
+    """)
+    
+    # Trigger 3: Count deletes (updates delete and re-insert) for the app's page cache
+    cursor.execute("""
+        CREATE TRIGGER trg_count_txn_deletes
+        AFTER DELETE ON transactions
+        FOR EACH ROW
+        BEGIN
+            UPDATE txn_deletes SET count = count + 1 WHERE id = 1;
         END
     """)
     
@@ -156,12 +240,18 @@ def insert_sample_data(cursor):
         ('TXN008', 'USER001', 1800.00, 'Delhi', '2024-01-15 10:06:00', 'Debit', 'OK'),
     ]
     
+    # One multi-row INSERT per batch, sized to stay under the parameter limit
+    batch_size = SQLITE_MAX_VARIABLES // 7
+    
     try:
-        cursor.executemany("""
-            INSERT OR IGNORE INTO transactions 
-            (transaction_id, user_id, amount, location, txn_time, txn_type, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, sample_transactions)
+        for start in range(0, len(sample_transactions), batch_size):
+            batch = sample_transactions[start:start + batch_size]
+            placeholders = ', '.join(['(?, ?, ?, ?, ?, ?, ?)'] * len(batch))
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO transactions 
+                (transaction_id, user_id, amount, location, txn_time, txn_type, status)
+                VALUES {placeholders}
+            """, list(itertools.chain.from_iterable(batch)))
         print("✓ Sample data inserted successfully")
     except sqlite3.Error as e:
         print(f"Note: Some sample data may already exist: {e}")
@@ -175,17 +265,29 @@ def main():
     conn, cursor = get_connection()
     
     try:
-        create_tables(cursor)
-        create_indexes(cursor)
-        create_view(cursor)
-        create_triggers(cursor)
-        
-        # Ask user if they want sample data
+        # Ask user if they want sample data (before BEGIN, so no lock is held while waiting)
         response = input("\nInsert sample data for testing? (y/n): ").strip().lower()
+        
+        # Run the whole schema setup and sample load as a single transaction
+        cursor.execute("BEGIN")
+        cursor.execute("PRAGMA user_version")
+        current_version = cursor.fetchone()[0]
+        
+        if current_version >= SCHEMA_VERSION:
+            print(f"✓ Schema is up to date (version {current_version}), skipping setup")
+        else:
+            upgrade_tables(cursor)
+            create_tables(cursor)
+            create_indexes(cursor)
+            create_view(cursor)
+            create_triggers(cursor)
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        
         if response == 'y':
             insert_sample_data(cursor)
         
-        conn.commit()
+        analyze_tables(cursor)
+        cursor.execute("COMMIT")
         print("\n" + "=" * 50)
         print("✓ Database initialization completed successfully!")
         print("=" * 50)
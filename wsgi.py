@@ -0,0 +1,10 @@
+"""
+WSGI Entry Point
+Exposes the Flask app for production servers, e.g.:
+    gunicorn -k gthread -w $(nproc) --threads 8 --preload wsgi:app
+"""
+
+from app import app
+
+if __name__ == "__main__":
+    app.run()